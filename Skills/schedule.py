@@ -1,21 +1,73 @@
 """
 任务调度器
-读取tasks文件夹中的py文件并依次执行，将生成的md文件保存到result文件夹下的日期文件夹中
+读取tasks文件夹中的py文件并并发执行，将生成的md文件保存到result文件夹下的日期文件夹中
 """
 
 import os
 import sys
+import ast
 import glob
+import json
 import shutil
-import subprocess
+import signal
+import asyncio
+import hashlib
+import multiprocessing
+import importlib
+import importlib.util
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from pathlib import Path
+from tasks._utf8 import ensure_utf8_stdio
 
 # 设置控制台编码为UTF-8
-if sys.platform == 'win32':
-    import io
-    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
-    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
+ensure_utf8_stdio()
+
+# 工作进程启动时预先导入的重量级依赖，后续任务无需重复导入
+HEAVY_MODULES = ["dotenv", "langchain_core", "langchain", "langgraph", "langchain_community", "langchain_tavily"]
+
+# 工作进程内已加载的任务模块缓存: {任务文件路径: 模块}
+_task_modules = {}
+
+
+def _preimport_heavy_libs(tasks_dir, pid_queue):
+    """
+    进程池工作进程的初始化函数
+    
+    登记工作进程的PID（任务超时时由调度器终止），切换到tasks目录
+    （每个工作进程有独立的工作目录，不存在竞争），并预先导入重量级依赖
+    
+    Args:
+        tasks_dir: tasks目录路径
+        pid_queue: 用于向调度器登记工作进程PID的队列
+    """
+    pid_queue.put(os.getpid())
+    ensure_utf8_stdio()
+    os.chdir(tasks_dir)
+    sys.path.insert(0, tasks_dir)
+    for name in HEAVY_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass
+
+
+def _run_task_in_worker(task_path, md_file_path):
+    """
+    在工作进程中调用任务模块的run()，模块在每个工作进程内只导入一次
+    
+    Args:
+        task_path: 任务文件路径
+        md_file_path: 传给run()的md文件路径
+    """
+    module = _task_modules.get(task_path)
+    if module is None:
+        module_name = f"_task_{Path(task_path).stem}"
+        spec = importlib.util.spec_from_file_location(module_name, task_path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _task_modules[task_path] = module
+    module.run(md_file_path)
 
 
 class TaskScheduler:
@@ -35,7 +87,13 @@ class TaskScheduler:
         self.tasks_dir = self.base_dir / "tasks"
         self.result_dir = self.base_dir / "result"
         self.current_date = datetime.now().strftime("%Y-%m-%d")
-        self.original_md_files = set()  # 记录原有的md文件
+        self.original_md_files = set()  # 记录原有的md文件: {(文件名, 修改时间ns), ...}
+        self.md_snapshot = set()  # tasks目录中的md文件: {(文件名, 修改时间ns), ...}
+        self.task_timeout = 300  # 单个任务超时时间（秒）
+        self.max_line_size = 1024 * 1024  # 子进程单行输出的最大长度（字节）
+        self._pool_timed_out = False  # 本次运行中是否有进程池任务超时
+        self.manifest_path = self.result_dir / ".manifest.json"  # 任务执行记录
+        self.manifest = {}
         
     def get_task_files(self):
         """
@@ -48,16 +106,21 @@ class TaskScheduler:
             print(f"错误: tasks文件夹不存在: {self.tasks_dir}")
             return []
         
+        # 扫描一次目录，md和py文件都从同一份快照中筛选
+        entries = self._scan_tasks_dir()
+        
         # 记录原有的md文件
-        self.original_md_files = set(self.tasks_dir.glob("*.md"))
+        self.original_md_files = self.md_snapshot
         if self.original_md_files:
             print(f"原有md文件: {len(self.original_md_files)} 个")
-            for md_file in self.original_md_files:
-                print(f"  - {md_file.name}")
+            for name, _ in self.original_md_files:
+                print(f"  - {name}")
         
-        # 获取所有py文件（排除__init__.py）
-        task_files = list(self.tasks_dir.glob("*.py"))
-        task_files = [f for f in task_files if f.name != "__init__.py"]
+        # 获取所有py文件（排除__init__.py、_utf8.py等下划线开头的辅助模块）
+        task_files = [
+            self.tasks_dir / name for name, is_file in entries
+            if is_file and name.endswith(".py") and not name.startswith("_")
+        ]
         
         print(f"找到 {len(task_files)} 个任务文件:")
         for i, task_file in enumerate(task_files, 1):
@@ -65,6 +128,108 @@ class TaskScheduler:
         
         return task_files
     
+    def _scan_tasks_dir(self):
+        """
+        使用os.scandir扫描一次tasks目录并缓存md文件快照
+        
+        直接使用目录项自带的文件名和类型信息，避免glob对每个文件的额外stat调用；
+        md文件同时记录修改时间，用于识别被任务改写的文件
+        
+        Returns:
+            list: [(文件名, 是否为文件), ...]
+        """
+        entries = []
+        md_snapshot = set()
+        with os.scandir(self.tasks_dir) as it:
+            for entry in it:
+                is_file = entry.is_file()
+                entries.append((entry.name, is_file))
+                if is_file and entry.name.endswith(".md"):
+                    md_snapshot.add((entry.name, entry.stat().st_mtime_ns))
+        self.md_snapshot = md_snapshot
+        return entries
+    
+    def _load_manifest(self):
+        """
+        读取上次运行留下的任务执行记录
+        
+        Returns:
+            dict: {任务文件名: {"task": 指纹, "inputs": 输入摘要, "date": 日期, "outputs": [文件名, ...]}}
+        """
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+    
+    def _save_manifest(self):
+        """
+        保存任务执行记录（先写临时文件再原子替换）
+        
+        保存失败只影响下次运行能否跳过任务，不影响本次结果，打印错误后继续
+        """
+        tmp_path = self.manifest_path.with_suffix(".tmp")
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.manifest, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.manifest_path)
+        except OSError as e:
+            print(f"保存任务执行记录失败: {e}")
+    
+    def _fingerprint(self, path):
+        """
+        计算文件指纹：修改时间、大小及前4KB内容的哈希
+        
+        Args:
+            path: 文件路径
+            
+        Returns:
+            dict: 文件指纹
+        """
+        st = os.stat(path)
+        with open(path, "rb") as f:
+            head = f.read(4096)
+        return {
+            "mtime_ns": st.st_mtime_ns,
+            "size": st.st_size,
+            "hash": hashlib.sha256(head).hexdigest()
+        }
+    
+    def _inputs_digest(self):
+        """
+        计算tasks目录中原有md文件（任务输入）的摘要
+        
+        Returns:
+            str: 摘要字符串
+        """
+        digest = hashlib.sha256()
+        for name, mtime_ns in sorted(self.original_md_files):
+            digest.update(f"{name}:{mtime_ns}\n".encode("utf-8"))
+        return digest.hexdigest()
+    
+    def is_task_cached(self, task_file, result_folder, fingerprint, inputs):
+        """
+        判断任务今天是否已经以相同的任务文件和输入执行成功，且结果文件仍在
+        
+        Args:
+            task_file: 任务文件路径
+            result_folder: 当天的结果文件夹
+            fingerprint: 任务文件当前指纹
+            inputs: 当前输入摘要
+            
+        Returns:
+            bool: 是否可以跳过执行
+        """
+        entry = self.manifest.get(task_file.name)
+        if not entry:
+            return False
+        return (
+            entry.get("task") == fingerprint
+            and entry.get("inputs") == inputs
+            and entry.get("date") == self.current_date
+            and all((result_folder / name).exists() for name in entry.get("outputs", []))
+        )
+    
     def create_result_folder(self):
         """
         在result文件夹下创建以当天日期命名的文件夹
@@ -82,102 +247,211 @@ class TaskScheduler:
         print(f"结果文件夹: {date_folder}")
         return date_folder
     
-    def execute_task(self, task_file):
+    def _has_run_entry(self, task_file):
         """
-        执行单个任务文件
+        判断任务文件是否定义了模块级的run()入口（只解析语法树，不执行文件）
         
         Args:
             task_file: 任务文件路径
             
         Returns:
-            bool: 执行是否成功
+            bool: 是否定义了run()
+        """
+        try:
+            tree = ast.parse(task_file.read_text(encoding="utf-8"))
+        except (OSError, SyntaxError, UnicodeDecodeError):
+            return False
+        return any(
+            isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.name == "run"
+            for node in tree.body
+        )
+    
+    async def execute_task_in_pool(self, task_file, md_files, pool):
+        """
+        在进程池中对每个md文件调用任务的run()，省去每个任务的解释器启动和依赖导入开销
+        
+        Args:
+            task_file: 任务文件路径
+            md_files: 传给run()的md文件路径列表
+            pool: 进程池
+            
+        Returns:
+            bool: 所有md文件是否都执行成功
         """
         print(f"\n{'='*80}")
-        print(f"开始执行任务: {task_file.name}")
+        print(f"开始执行任务: {task_file.name}（进程池，{len(md_files)} 个md文件）")
         print(f"{'='*80}")
         
-        try:
-            # 切换到tasks目录执行
-            original_dir = os.getcwd()
-            os.chdir(self.tasks_dir)
-            
-            # 执行py文件
-            result = subprocess.run(
-                [sys.executable, task_file.name],
-                capture_output=True,
-                text=True,
-                encoding='utf-8',
-                timeout=300  # 5分钟超时
-            )
-            
-            # 恢复原目录
-            os.chdir(original_dir)
-            
-            if result.returncode == 0:
-                print(f"✓ 任务执行成功: {task_file.name}")
-                if result.stdout:
-                    print(result.stdout)
+        loop = asyncio.get_running_loop()
+        
+        async def run_one(md_file):
+            try:
+                await asyncio.wait_for(
+                    loop.run_in_executor(pool, _run_task_in_worker, str(task_file), str(md_file)),
+                    timeout=self.task_timeout
+                )
                 return True
-            else:
-                print(f"✗ 任务执行失败: {task_file.name}")
-                if result.stderr:
-                    print(f"错误信息: {result.stderr}")
+            except asyncio.TimeoutError:
+                # 超时的run()仍占用着工作进程，结束后由run()终止进程池
+                self._pool_timed_out = True
+                print(f"✗ 任务超时: {task_file.name} ({md_file.name})")
+                return False
+            except Exception as e:
+                print(f"✗ 任务执行异常: {task_file.name} ({md_file.name})")
+                print(f"异常信息: {str(e)}")
                 return False
+        
+        results = await asyncio.gather(*[run_one(md_file) for md_file in md_files])
+        if all(results):
+            print(f"✓ 任务执行成功: {task_file.name}")
+            return True
+        print(f"✗ 任务执行失败: {task_file.name}")
+        return False
+    
+    async def execute_task(self, task_file, semaphore):
+        """
+        执行单个任务文件
+        
+        Args:
+            task_file: 任务文件路径
+            semaphore: 限制并发任务数的信号量
+            
+        Returns:
+            bool: 执行是否成功
+        """
+        async with semaphore:
+            print(f"\n{'='*80}")
+            print(f"开始执行任务: {task_file.name}")
+            print(f"{'='*80}")
+            
+            try:
+                # 在tasks目录下执行py文件（使用cwd参数，避免并发任务之间竞争os.chdir）
+                # stderr合并到stdout，逐行转发输出
+                proc = await asyncio.create_subprocess_exec(
+                    sys.executable, task_file.name,
+                    cwd=self.tasks_dir,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.STDOUT,
+                    limit=self.max_line_size
+                )
                 
-        except subprocess.TimeoutExpired:
-            print(f"✗ 任务超时: {task_file.name}")
-            os.chdir(original_dir)
-            return False
-        except Exception as e:
-            print(f"✗ 任务执行异常: {task_file.name}")
-            print(f"异常信息: {str(e)}")
-            os.chdir(original_dir)
-            return False
+                try:
+                    await asyncio.wait_for(
+                        self._stream_output(proc, task_file.name),
+                        timeout=self.task_timeout  # 5分钟超时
+                    )
+                except asyncio.TimeoutError:
+                    print(f"✗ 任务超时: {task_file.name}")
+                    return False
+                finally:
+                    # 超时或读取输出出错（如单行超过max_line_size）时，结束并回收子进程
+                    if proc.returncode is None:
+                        try:
+                            proc.kill()
+                        except ProcessLookupError:
+                            pass
+                        await proc.wait()
+                
+                if proc.returncode == 0:
+                    print(f"✓ 任务执行成功: {task_file.name}")
+                    return True
+                else:
+                    print(f"✗ 任务执行失败: {task_file.name} (返回码: {proc.returncode})")
+                    return False
+                    
+            except Exception as e:
+                print(f"✗ 任务执行异常: {task_file.name}")
+                print(f"异常信息: {str(e)}")
+                return False
+    
+    async def _stream_output(self, proc, task_name):
+        """
+        实时转发子进程输出，直到子进程结束
+        
+        每次只持有一行输出，并在行首加上任务名，便于区分并发任务的日志
+        
+        Args:
+            proc: asyncio子进程
+            task_name: 任务文件名
+        """
+        prefix = f"[{task_name}] ".encode("utf-8")
+        # stdout被替换（如StringIO、部分IDE控制台）时没有buffer，改为解码后打印
+        buffer = getattr(sys.stdout, "buffer", None)
+        async for line in proc.stdout:
+            if buffer is None:
+                print((prefix + line).decode("utf-8", errors="replace"), end="")
+                continue
+            sys.stdout.flush()
+            buffer.write(prefix + line)
+            buffer.flush()
+        await proc.wait()
     
     def find_generated_md_files(self):
         """
-        查找tasks文件夹中新生成的md文件（排除原有文件）
+        查找tasks文件夹中新生成或被改写的md文件（排除未变化的原有文件）
         
         Returns:
-            list: 新生成的md文件路径列表
+            list: 新生成或被改写的md文件路径列表
         """
-        # 获取当前所有md文件
-        current_md_files = set(self.tasks_dir.glob("*.md"))
+        # 任务执行后重新扫描一次目录
+        self._scan_tasks_dir()
         
-        # 找出新生成的md文件（当前文件 - 原有文件）
-        new_md_files = current_md_files - self.original_md_files
+        # 当前快照 - 原有快照：文件名或修改时间不同的即为新生成或被改写的文件
+        changed = self.md_snapshot - self.original_md_files
         
-        return list(new_md_files)
+        return [self.tasks_dir / name for name, _ in changed]
     
     def move_md_files(self, target_folder):
         """
-        将新生成的md文件移动到目标文件夹（不移动原有md文件）
+        将新生成的md文件移动到目标文件夹（被改写的原有md文件只复制，不移动）
         
         Args:
             target_folder: 目标文件夹路径
+            
+        Returns:
+            list: 移动后的文件名列表
         """
         md_files = self.find_generated_md_files()
+        moved_names = []
         
         if not md_files:
             print("未找到新生成的md文件")
-            return
+            return moved_names
+        
+        print(f"\n找到 {len(md_files)} 个新生成或被改写的md文件，正在移动...")
         
-        print(f"\n找到 {len(md_files)} 个新生成的md文件，正在移动...")
+        original_names = {name for name, _ in self.original_md_files}
+        
+        # 一次扫描目标文件夹得到已有文件名，避免逐个文件调用exists()
+        with os.scandir(target_folder) as it:
+            existing_names = {entry.name for entry in it}
         
         for md_file in md_files:
-            target_path = target_folder / md_file.name
+            target_name = md_file.name
             
-            # 如果目标文件已存在，添加时间戳
-            if target_path.exists():
-                timestamp = datetime.now().strftime("%H%M%S")
-                stem = target_path.stem
-                new_name = f"{stem}_{timestamp}.md"
-                target_path = target_folder / new_name
+            # 如果目标文件已存在，添加时间戳（取源文件的修改时间）
+            if target_name in existing_names:
+                timestamp = datetime.fromtimestamp(md_file.stat().st_mtime).strftime("%H%M%S")
+                target_name = f"{md_file.stem}_{timestamp}.md"
             
-            shutil.move(str(md_file), str(target_path))
+            target_path = target_folder / target_name
+            if md_file.name in original_names:
+                # 原有文件保留在tasks目录中
+                shutil.copy2(md_file, target_path)
+            else:
+                try:
+                    # 同一文件系统内直接重命名
+                    os.replace(md_file, target_path)
+                except OSError:
+                    # 跨设备时回退到复制+删除
+                    shutil.move(str(md_file), str(target_path))
+            existing_names.add(target_name)
+            moved_names.append(target_name)
             print(f"  ✓ {md_file.name} -> {target_path.relative_to(self.base_dir)}")
+        
+        return moved_names
     
-    def run(self):
+    async def run(self):
         """
         运行任务调度器
         """
@@ -198,26 +472,82 @@ class TaskScheduler:
         # 2. 创建结果文件夹
         result_folder = self.create_result_folder()
         
-        # 3. 依次执行任务
-        success_count = 0
-        fail_count = 0
-        
+        # 3. 跳过今天已执行过且任务文件和输入均未变化的任务
+        self.manifest = self._load_manifest()
+        inputs = self._inputs_digest()
+        fingerprints = {task_file: self._fingerprint(task_file) for task_file in task_files}
+        pending_tasks = []
+        skip_count = 0
         for task_file in task_files:
-            if self.execute_task(task_file):
-                success_count += 1
+            if self.is_task_cached(task_file, result_folder, fingerprints[task_file], inputs):
+                print(f"↷ 任务未变化且今日结果已存在，跳过: {task_file.name}")
+                skip_count += 1
             else:
-                fail_count += 1
+                pending_tasks.append(task_file)
+        
+        # 4. 并发执行任务（用信号量限制同时运行的子进程数）
+        success_count = 0
+        fail_count = 0
+        if pending_tasks:
+            max_workers = os.cpu_count() or 1
+            semaphore = asyncio.Semaphore(min(len(pending_tasks), max_workers))
+            
+            # 定义了run()的任务在进程池中调用，其余任务仍以子进程方式执行
+            md_files = [self.tasks_dir / name for name, _ in sorted(self.original_md_files)]
+            pooled_tasks = {task_file for task_file in pending_tasks if self._has_run_entry(task_file)}
+            pool = None
+            self._pool_timed_out = False
+            if pooled_tasks and md_files:
+                # 任务耗时主要在等待大模型和搜索接口，每个(任务, md文件)分配一个工作进程，
+                # 避免任务在进程池队列中排队时耗掉超时时间
+                pid_queue = multiprocessing.SimpleQueue()
+                pool = ProcessPoolExecutor(
+                    max_workers=len(pooled_tasks) * len(md_files),
+                    initializer=_preimport_heavy_libs,
+                    initargs=(str(self.tasks_dir), pid_queue)
+                )
+            
+            try:
+                results = await asyncio.gather(*[
+                    self.execute_task_in_pool(task_file, md_files, pool) if pool and task_file in pooled_tasks
+                    else self.execute_task(task_file, semaphore)
+                    for task_file in pending_tasks
+                ])
+            finally:
+                if pool and self._pool_timed_out:
+                    # 有任务超时，其工作进程不会自行结束：按登记的PID直接终止，避免阻塞等待
+                    while not pid_queue.empty():
+                        try:
+                            os.kill(pid_queue.get(), signal.SIGTERM)
+                        except OSError:
+                            pass
+                    pool.shutdown(wait=False, cancel_futures=True)
+                elif pool:
+                    pool.shutdown()
+            success_count = sum(results)
+            fail_count = len(results) - success_count
         
-        # 4. 移动生成的md文件
-        self.move_md_files(result_folder)
+            # 5. 移动生成的md文件，并记录成功任务的执行信息
+            # 并发执行时无法区分各任务的输出，本次生成的文件都记录到每个成功任务下
+            moved_names = self.move_md_files(result_folder)
+            for task_file, ok in zip(pending_tasks, results):
+                if ok:
+                    self.manifest[task_file.name] = {
+                        "task": fingerprints[task_file],
+                        "inputs": inputs,
+                        "date": self.current_date,
+                        "outputs": moved_names
+                    }
+            self._save_manifest()
         
-        # 5. 输出统计信息
+        # 6. 输出统计信息
         print("\n" + "="*80)
         print("任务调度完成")
         print("="*80)
         print(f"总任务数: {len(task_files)}")
         print(f"成功: {success_count}")
         print(f"失败: {fail_count}")
+        print(f"跳过: {skip_count}")
         print(f"结果保存在: {result_folder.relative_to(self.base_dir)}")
         print("="*80 + "\n")
 
@@ -225,7 +555,7 @@ class TaskScheduler:
 def main():
     """主函数"""
     scheduler = TaskScheduler()
-    scheduler.run()
+    asyncio.run(scheduler.run())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,20 @@
+"""
+控制台编码设置
+在Windows下将标准输出/错误流切换为UTF-8，供调度器和各任务模块共用
+"""
+
+import sys
+
+
+def ensure_utf8_stdio():
+    """
+    确保标准输出和标准错误使用UTF-8编码
+    
+    直接对现有流调用reconfigure，不再重新包装TextIOWrapper；
+    已经是UTF-8时不做任何处理，重复调用也是安全的
+    """
+    if sys.platform != 'win32':
+        return
+    for stream in (sys.stdout, sys.stderr):
+        if stream is not None and (stream.encoding or '').lower() != 'utf-8':
+            stream.reconfigure(encoding='utf-8')
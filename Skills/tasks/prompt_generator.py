@@ -6,13 +6,53 @@
 import os
 import re
 import sys
-from typing import Dict, List, Tuple
+import hashlib
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from _utf8 import ensure_utf8_stdio
+
+# 可选依赖：pyahocorasick，未安装时回退到预编译正则
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+# 技能文件最大读取字符数，超出部分不会被读取（元数据和工作流程通常位于文件开头）
+MAX_SKILL_CHARS = 64 * 1024
+
+# 系统提示词磁盘缓存目录，缓存以文件内容哈希为键，内容变化后自动失效
+PROMPT_CACHE_DIR = Path.home() / ".cache" / "aihub" / "prompts"
+# 提示词生成逻辑（关键词、模板）变化时递增，使旧缓存失效
+PROMPT_CACHE_VERSION = "5"
+# 每个生成器实例在进程内缓存的提示词数量上限
+PROMPT_MEMORY_CACHE_SIZE = 128
 
 # 设置控制台编码为UTF-8
-if sys.platform == 'win32':
-    import io
-    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
-    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
+ensure_utf8_stdio()
+
+
+def _build_keyword_automaton(role_keywords):
+    """
+    用所有(角色, 关键词)构建Aho-Corasick自动机
+    
+    Args:
+        role_keywords: 角色关键词映射
+        
+    Returns:
+        ahocorasick.Automaton or None: 自动机实例，未安装pyahocorasick时返回None
+    """
+    if ahocorasick is None:
+        return None
+    
+    automaton = ahocorasick.Automaton()
+    for role, info in role_keywords.items():
+        for keyword in info["keywords"]:
+            # 同一关键词可能属于多个角色，按关键词聚合角色列表
+            roles = automaton.get(keyword, ())
+            automaton.add_word(keyword, roles + (role,))
+    automaton.make_automaton()
+    return automaton
 
 
 class SystemPromptGenerator:
@@ -71,22 +111,44 @@ class SystemPromptGenerator:
         "监控预警": ["监控", "预警", "跟踪", "追踪", "检测"]
     }
     
-    def __init__(self):
-        """初始化生成器"""
-        pass
+    # 所有角色关键词的Aho-Corasick自动机，一次线性扫描即可完成所有角色计分
+    _ROLE_AUTOMATON = _build_keyword_automaton(ROLE_KEYWORDS)
+    
+    # 预编译的工作流程模式（按优先级排列）
+    _WORKFLOW_PATTERNS = [
+        re.compile(r"操作流程.*?\n(.*?)(?=\n##|\n---|\Z)", re.DOTALL | re.IGNORECASE),
+        re.compile(r"执行步骤.*?\n(.*?)(?=\n##|\n---|\Z)", re.DOTALL | re.IGNORECASE),
+        re.compile(r"工作流程.*?\n(.*?)(?=\n##|\n---|\Z)", re.DOTALL | re.IGNORECASE)
+    ]
+    _STEP_PATTERN = re.compile(
+        r"(?:第[一二三四五六七八九十]+步|Step\s*\d+|步骤\d*|^\d+\.)\s*[:：]?\s*(.+)",
+        re.MULTILINE
+    )
+    
+    def __init__(self, cache_dir=PROMPT_CACHE_DIR):
+        """
+        初始化生成器
+        
+        Args:
+            cache_dir: 系统提示词磁盘缓存目录，为None时不使用磁盘缓存
+        """
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        # 进程内缓存: {文件内容: 系统提示词}，按插入顺序淘汰最早的条目
+        self._prompt_cache = {}
     
-    def read_skill_file(self, file_path: str) -> str:
+    def read_skill_file(self, file_path: str, max_chars: Optional[int] = MAX_SKILL_CHARS) -> str:
         """
         读取技能文件内容
         
         Args:
             file_path: 技能文件路径
+            max_chars: 最多读取的字符数，默认为MAX_SKILL_CHARS；为None时读取整个文件
             
         Returns:
             str: 文件内容
         """
         with open(file_path, "r", encoding="utf-8") as f:
-            return f.read()
+            return f.read(max_chars)
     
     def extract_metadata(self, content: str) -> Dict[str, str]:
         """
@@ -104,21 +166,20 @@ class SystemPromptGenerator:
         if content.startswith("---"):
             parts = content.split("---", 2)
             if len(parts) >= 3:
-                yaml_content = parts[1]
-                # 提取name
-                name_match = re.search(r"name:\s*(.+)", yaml_content)
-                if name_match:
-                    metadata["name"] = name_match.group(1).strip()
-                
-                # 提取description
-                desc_match = re.search(r"description:\s*(.+)", yaml_content)
-                if desc_match:
-                    metadata["description"] = desc_match.group(1).strip()
-                
-                # 提取tags
-                tags_match = re.search(r"tags:\s*\[(.+)\]", yaml_content)
-                if tags_match:
-                    metadata["tags"] = [tag.strip() for tag in tags_match.group(1).split(",")]
+                # 逐行扫描一次YAML头，按键名分派（只取每个键第一次出现的值）
+                for line in parts[1].splitlines():
+                    key, sep, value = line.partition(":")
+                    if not sep:
+                        continue
+                    key = key.strip()
+                    value = value.strip()
+                    if not value or key in metadata:
+                        continue
+                    
+                    if key in ("name", "description"):
+                        metadata[key] = value
+                    elif key == "tags" and value.startswith("[") and value.endswith("]"):
+                        metadata["tags"] = [tag.strip() for tag in value[1:-1].split(",")]
         
         return metadata
     
@@ -141,14 +202,14 @@ class SystemPromptGenerator:
             search_text += " " + metadata["description"].lower()
         
         # 统计每个角色的关键词匹配次数
-        role_scores = {}
-        for role, role_info in self.ROLE_KEYWORDS.items():
-            score = 0
-            for keyword in role_info["keywords"]:
-                # 计算关键词出现次数
-                count = len(re.findall(keyword, search_text))
-                score += count
-            role_scores[role] = score
+        if self._ROLE_AUTOMATON is not None:
+            # 单次扫描文本，按命中关键词所属角色累加得分
+            role_scores = dict.fromkeys(self.ROLE_KEYWORDS, 0)
+            for _, roles in self._ROLE_AUTOMATON.iter(search_text):
+                for role in roles:
+                    role_scores[role] += 1
+        else:
+            role_scores = self._score_roles_by_count(search_text, metadata)
         
         # 选择得分最高的角色
         if role_scores:
@@ -159,6 +220,43 @@ class SystemPromptGenerator:
         # 默认角色
         return "专业分析师", "资深专业分析师，专注于提供高质量的分析服务"
     
+    def _score_roles_by_count(self, search_text: str, metadata: Dict) -> Dict[str, int]:
+        """
+        用str.count统计各角色的关键词得分，跳过不可能胜出的角色
+        
+        关键词的出现次数不会超过其任一字符在文本中的出现次数，据此得到每个角色的得分上界；
+        上界低于当前最高分的角色无需计数。标签中提到的角色优先计算，以便尽早得到较高的分数
+        
+        Args:
+            search_text: 小写化后的待匹配文本
+            metadata: 元数据
+            
+        Returns:
+            Dict[str, int]: 已计算角色的得分，按ROLE_KEYWORDS的顺序排列
+        """
+        char_counts = Counter(search_text)
+        tags_text = " ".join(metadata.get("tags", []))
+        # 标签命中的角色排在前面（sorted是稳定排序，其余保持原顺序）
+        role_order = sorted(
+            self.ROLE_KEYWORDS,
+            key=lambda role: not any(kw in tags_text for kw in self.ROLE_KEYWORDS[role]["keywords"])
+        )
+        
+        scores = {}
+        best_score = 0
+        for role in role_order:
+            keywords = self.ROLE_KEYWORDS[role]["keywords"]
+            upper_bound = sum(min(char_counts[c] for c in kw) for kw in keywords)
+            if upper_bound < best_score:
+                continue
+            # 关键词均为普通字符串，直接用str.count做子串计数，无需经过正则引擎
+            score = sum(search_text.count(kw) for kw in keywords)
+            scores[role] = score
+            best_score = max(best_score, score)
+        
+        # 恢复原始顺序，保证得分相同时的选择结果不变
+        return {role: scores[role] for role in self.ROLE_KEYWORDS if role in scores}
+    
     def identify_task_type(self, content: str) -> str:
         """
         识别任务类型
@@ -173,8 +271,8 @@ class SystemPromptGenerator:
         task_scores = {}
         
         for task_type, keywords in self.TASK_KEYWORDS.items():
-            score = sum(1 for kw in keywords if kw in content_lower)
-            task_scores[task_type] = score
+            # 统计出现过的不同关键词个数（子串查找，不经过正则引擎）
+            task_scores[task_type] = sum(1 for kw in keywords if kw in content_lower)
         
         if task_scores:
             best_task = max(task_scores, key=task_scores.get)
@@ -195,39 +293,107 @@ class SystemPromptGenerator:
         """
         steps = []
         
-        # 查找操作流程部分
-        workflow_patterns = [
-            r"操作流程.*?\n(.*?)(?=\n##|\n---|\Z)",
-            r"执行步骤.*?\n(.*?)(?=\n##|\n---|\Z)",
-            r"工作流程.*?\n(.*?)(?=\n##|\n---|\Z)"
-        ]
-        
-        for pattern in workflow_patterns:
-            match = re.search(pattern, content, re.DOTALL | re.IGNORECASE)
+        # 查找操作流程部分，当前模式下没有步骤时尝试下一个模式
+        for pattern in self._WORKFLOW_PATTERNS:
+            match = pattern.search(content)
             if match:
-                workflow_content = match.group(1)
                 # 提取步骤
-                step_matches = re.findall(r"(?:第[一二三四五六七八九十]+步|Step\s*\d+|步骤\d*|^\d+\.)\s*[:：]?\s*(.+)", 
-                                         workflow_content, re.MULTILINE)
+                step_matches = self._STEP_PATTERN.findall(match.group(1))
                 if step_matches:
                     steps = [s.strip() for s in step_matches]
                     break
         
         return steps
     
-    def generate_system_prompt(self, skill_file_path: str) -> str:
+    def generate_system_prompt(self, skill_file_path: str, max_chars: Optional[int] = MAX_SKILL_CHARS) -> str:
         """
         根据技能文件生成系统提示词
         
         Args:
             skill_file_path: 技能文件路径
+            max_chars: 最多读取的字符数，为None时读取整个文件
             
         Returns:
             str: 生成的系统提示词
         """
         # 读取文件内容
-        content = self.read_skill_file(skill_file_path)
+        content = self.read_skill_file(skill_file_path, max_chars)
+        
+        return self.build_system_prompt(content)
+    
+    def build_system_prompt(self, content: str) -> str:
+        """
+        根据技能文件内容生成系统提示词，结果在进程内和磁盘上缓存
         
+        Args:
+            content: 文件内容
+            
+        Returns:
+            str: 生成的系统提示词
+        """
+        system_prompt = self._prompt_cache.get(content)
+        if system_prompt is not None:
+            return system_prompt
+        
+        key = hashlib.blake2b(
+            (PROMPT_CACHE_VERSION + content).encode("utf-8"), digest_size=16
+        ).hexdigest()
+        
+        system_prompt = self._read_cached_prompt(key)
+        if system_prompt is None:
+            system_prompt = self.render_system_prompt(content)
+            self._write_cached_prompt(key, system_prompt)
+        
+        if len(self._prompt_cache) >= PROMPT_MEMORY_CACHE_SIZE:
+            self._prompt_cache.pop(next(iter(self._prompt_cache)))
+        self._prompt_cache[content] = system_prompt
+        return system_prompt
+    
+    def _read_cached_prompt(self, key: str) -> Optional[str]:
+        """
+        从磁盘缓存读取系统提示词
+        
+        Args:
+            key: 缓存键
+            
+        Returns:
+            Optional[str]: 缓存的系统提示词，不存在时返回None
+        """
+        if self.cache_dir is None:
+            return None
+        try:
+            return (self.cache_dir / key).read_text(encoding="utf-8")
+        except OSError:
+            return None
+    
+    def _write_cached_prompt(self, key: str, system_prompt: str):
+        """
+        将系统提示词写入磁盘缓存（先写临时文件再原子替换）
+        
+        Args:
+            key: 缓存键
+            system_prompt: 系统提示词
+        """
+        if self.cache_dir is None:
+            return
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.cache_dir / f"{key}.{os.getpid()}.tmp"
+            tmp_path.write_text(system_prompt, encoding="utf-8")
+            os.replace(tmp_path, self.cache_dir / key)
+        except OSError as e:
+            print(f"写入提示词缓存失败: {e}")
+    
+    def render_system_prompt(self, content: str) -> str:
+        """
+        根据技能文件内容生成系统提示词（不使用缓存）
+        
+        Args:
+            content: 文件内容
+            
+        Returns:
+            str: 生成的系统提示词
+        """
         # 提取元数据
         metadata = self.extract_metadata(content)
         
@@ -240,28 +406,27 @@ class SystemPromptGenerator:
         # 提取工作流程步骤
         workflow_steps = self.extract_workflow_steps(content)
         
-        # 生成系统提示词
-        system_prompt = f"你是一名{role_description}。\n\n"
+        # 生成系统提示词（各部分先放入列表，最后一次性拼接）
+        parts = [f"你是一名{role_description}。\n\n"]
         
         # 添加任务描述
         if "description" in metadata:
-            system_prompt += f"你的任务是{metadata['description']}\n\n"
+            parts.append(f"你的任务是{metadata['description']}\n\n")
         else:
-            system_prompt += f"你的任务是执行{task_type}工作。\n\n"
+            parts.append(f"你的任务是执行{task_type}工作。\n\n")
         
         # 添加技能要求
-        system_prompt += "你需要按照以下技能要求执行工作：\n\n"
-        system_prompt += f"{content}\n\n"
+        parts.append("你需要按照以下技能要求执行工作：\n\n")
+        parts.append(f"{content}\n\n")
         
         # 添加执行步骤
         if workflow_steps:
-            system_prompt += "请严格按照以下步骤执行：\n"
-            for i, step in enumerate(workflow_steps, 1):
-                system_prompt += f"{i}. {step}\n"
+            parts.append("请严格按照以下步骤执行：\n")
+            parts.extend(f"{i}. {step}\n" for i, step in enumerate(workflow_steps, 1))
         else:
-            system_prompt += "请严格按照技能文件中的操作流程执行任务。\n"
+            parts.append("请严格按照技能文件中的操作流程执行任务。\n")
         
-        return system_prompt
+        return "".join(parts)
 
 
 def generate_system_prompt_from_skill(skill_file_path: str) -> str:
@@ -274,8 +439,11 @@ def generate_system_prompt_from_skill(skill_file_path: str) -> str:
     Returns:
         str: 生成的系统提示词
     """
-    generator = SystemPromptGenerator()
-    return generator.generate_system_prompt(skill_file_path)
+    return _default_generator.generate_system_prompt(skill_file_path)
+
+
+# 便捷函数共用的生成器实例，使进程内缓存在多次调用间生效
+_default_generator = SystemPromptGenerator()
 
 
 # 示例用法
@@ -6,6 +6,7 @@
 import os
 import sys
 import glob
+import asyncio
 import dotenv
 from pathlib import Path
 from datetime import datetime
@@ -17,12 +18,10 @@ from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from langgraph.prebuilt import create_react_agent
 from langchain.agents import create_agent
+from _utf8 import ensure_utf8_stdio
 
 # 设置控制台编码为UTF-8
-if sys.platform == 'win32':
-    import io
-    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
-    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
+ensure_utf8_stdio()
 
 # 加载环境变量
 # load_dotenv()
@@ -41,13 +40,17 @@ llm = ChatZhipuAI(
     model="GLM-4-Flash",
 )
 
-def prompt_generator(name):
-    # 读取技能文件内容
-    with open(name, "r", encoding="utf-8") as f:
-        skill_content = f.read()
+# 获取tavily实例（TavilySearch 继承 BaseTool，可直接作为工具使用，无需 StructuredTool 包装）
+# 所有任务共用同一个实例
+_search = TavilySearch(max_results=3) #内置工具名称、描述等信息
 
-    # 定义角色
-    role = llm.invoke(f"请根据用户问题:{skill_content}，推断用户可能需要什么职业的人士来进行解答。回答结果只包含职业即可").content
+# 同时处理的md文件数量上限
+MAX_CONCURRENT_TASKS = 4
+
+async def prompt_generator(name, skill_content):
+    # 技能文件内容由调用方读取后传入，避免重复读取文件
+    # 定义角色（异步调用，多个文件的角色推断可以并发进行）
+    role = (await llm.ainvoke(f"请根据用户问题:{skill_content}，推断用户可能需要什么职业的人士来进行解答。回答结果只包含职业即可")).content
     print(role)
     # 创建系统提示词
     system_prompt = f"""你是一名{role}，专注于美股七大科技巨头的投资分析。
@@ -67,15 +70,16 @@ def prompt_generator(name):
 # 创建 ReAct Agent
 # os.environ["TAVILY_API_KEY"] = "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"
 
-def run_analysis(name):
-    # 获取tavily实例（TavilySearch 继承 BaseTool，可直接作为工具使用，无需 StructuredTool 包装）
-    search = TavilySearch(max_results=3) #内置工具名称、描述等信息
+def get_agent(system_prompt):
+    """创建使用该系统提示词的agent（提示词包含技能内容和推断出的角色，每次调用都不同，不做缓存）"""
+    return create_agent(model=llm, tools=[_search], system_prompt=system_prompt, debug=True)
 
+async def run_analysis(name, skill_content):
     # 获取提示词
-    system_prompt = prompt_generator(name)
+    system_prompt = await prompt_generator(name, skill_content)
 
-    # 获取agent Executor实例，执行invoke
-    agent = create_agent(model=llm, tools=[search], system_prompt=system_prompt, debug=True)
+    # 创建agent实例，执行ainvoke
+    agent = get_agent(system_prompt)
 
     """执行美股分析任务"""
     print("=" * 80)
@@ -86,7 +90,7 @@ def run_analysis(name):
     
     try:
         # 执行 Agent
-        result = agent.invoke({
+        result = await agent.ainvoke({
             "messages": [("human", f"请开始执行分析任务。当前日期：{current_date}")]
         })
         
@@ -127,6 +131,34 @@ def run_analysis(name):
         traceback.print_exc()
         raise
 
+def run(md_file_path):
+    """调度器入口：处理单个md文件"""
+    skill_content = Path(md_file_path).read_text(encoding="utf-8")
+    return asyncio.run(run_analysis(md_file_path, skill_content))
+
+async def process_file(md_file, semaphore):
+    """处理单个md文件，返回是否成功"""
+    async with semaphore:
+        print(f"\n开始处理: {os.path.basename(md_file)}")
+        print("="*80)
+        try:
+            # 只读取一次技能文件，内容随流程向下传递
+            skill_content = Path(md_file).read_text(encoding="utf-8")
+            await run_analysis(md_file, skill_content)
+            print(f"\n✓ 完成: {os.path.basename(md_file)}")
+            return True
+        except Exception as e:
+            print(f"\n✗ 失败: {os.path.basename(md_file)}")
+            print(f"错误: {str(e)}")
+            return False
+        finally:
+            print("="*80 + "\n")
+
+async def main(md_files):
+    # 并发处理所有md文件，用信号量限制同时进行的请求数
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_TASKS)
+    await asyncio.gather(*(process_file(md_file, semaphore) for md_file in md_files))
+
 if __name__ == "__main__":
     # 获取当前文件夹下所有md文件
     current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -142,14 +174,4 @@ if __name__ == "__main__":
     
     print("\n" + "="*80)
     
-    # 依次处理每个md文件
-    for md_file in md_files:
-        print(f"\n开始处理: {os.path.basename(md_file)}")
-        print("="*80)
-        try:
-            run_analysis(md_file)
-            print(f"\n✓ 完成: {os.path.basename(md_file)}")
-        except Exception as e:
-            print(f"\n✗ 失败: {os.path.basename(md_file)}")
-            print(f"错误: {str(e)}")
-        print("="*80 + "\n")
+    asyncio.run(main(md_files))
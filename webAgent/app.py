@@ -1,15 +1,17 @@
-from flask import Flask, request, jsonify
-from flask_cors import CORS
+from fastapi import FastAPI, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from create import create_chat,create_prompt,create_search_prompt
 from search import search_relevant_info,search_relevant_info_in_chroma
-from vector import get_chroma_vectorstore
-from tools import getInfo
+from tools import getInfo, get_vectorstore
 from chat import SessionManager
 import threading
+import asyncio
 import uuid
 import logging
 import time
 import re
+import uvicorn
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -31,32 +33,46 @@ except Exception as e:
     logger.error(f"SessionManager初始化失败: {e}")
     session_manager = None
 
-app = Flask(__name__)
-CORS(app)  # 允许跨域请求，以便Vue前端可以访问
+# 大模型实例和Chroma向量数据库在启动时创建一次，所有请求共用
+# 向量数据库由tools统一缓存，/vueflasks与SessionManager共用同一实例
+chat = create_chat()
+get_vectorstore()
+
+app = FastAPI()
+# 允许跨域请求，以便Vue前端可以访问
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
 
 # 测试路由
-@app.route('/api/test', methods=['GET'])
-def test():
-    return jsonify({"message": "Hello from Flask!"})
+@app.get('/api/test')
+async def test():
+    return {"message": "Hello from FastAPI!"}
 
 # 接收前端POST请求的路由
-@app.route('/vueflasks',methods=['POST','GET'])
-def vueflasks():
-    chat = create_chat()
+@app.api_route('/vueflasks', methods=['POST', 'GET'])
+async def vueflasks(request: Request):
     if request.method == 'POST':
         # 获取vue中传递的值
-        GetMSG = request.get_data(as_text=True)
-        role = chat.invoke(f"请根据用户问题，推断用户可能需要什么职业的人士来进行解答：{GetMSG}。回答结果只包含职业即可").content
+        GetMSG = (await request.body()).decode('utf-8', errors='replace')
+        # 角色推断和资料检索互不依赖，并发执行（getInfo是同步函数，放到线程中运行）
+        role_message, search_results = await asyncio.gather(
+            chat.ainvoke(f"请根据用户问题，推断用户可能需要什么职业的人士来进行解答：{GetMSG}。回答结果只包含职业即可"),
+            asyncio.to_thread(getInfo, GetMSG)
+        )
+        role = role_message.content
         # print(role)
-        search_results = getInfo(GetMSG)
         chat_prompt = create_search_prompt(role,GetMSG,search_results)
-        msg = chat.invoke(chat_prompt.format_messages(user_question=GetMSG, search_results=search_results)).content
-        return jsonify(msg)
+        msg = (await chat.ainvoke(chat_prompt.format_messages(user_question=GetMSG))).content
+        return msg
     else:
-        return 'defeat'
+        return PlainTextResponse('defeat')
 
-@app.route('/vueflask',methods=['POST','GET'])
-def vueflask():
+@app.api_route('/vueflask', methods=['POST', 'GET'])
+async def vueflask(request: Request):
     """
     处理前端Vue项目的请求
     - 基于IP地址管理会话
@@ -65,49 +81,63 @@ def vueflask():
     try:
         if request.method == 'POST':
             # 获取vue中传递的值
-            GetMSG = request.get_data(as_text=True)
-            logger.info(f"接收到消息: {GetMSG[:100]}..." if len(GetMSG) > 100 else f"接收到消息: {GetMSG}")
-            
-            # 检查SessionManager是否初始化成功
-            if session_manager is None:
-                logger.error("SessionManager未初始化，无法处理请求")
-                return jsonify({"error": "服务未初始化，请稍后再试"})
-            
+            GetMSG = (await request.body()).decode('utf-8', errors='replace')
             # 从request中提取客户端IP地址
-            client_ip = request.remote_addr
-            logger.info(f"客户端IP地址: {client_ip}")
-            
-            # 线程安全地获取或生成session_id
-            with ip_session_lock:
-                if client_ip in ip_session_map:
-                    session_id = ip_session_map[client_ip]
-                    logger.info(f"IP {client_ip} 已存在会话: {session_id}")
-                else:
-                    # 生成新的session_id
-                    # 使用UUID结合时间戳和IP地址生成唯一且安全的session_id
-                    # session_id = f"session_{uuid.uuid4()}_{int(time.time())}_{hash(client_ip) % 10000}"
-                    session_id = session_manager.create_session()
-                    ip_session_map[client_ip] = session_id
-                    logger.info(f"为IP {client_ip} 创建新会话: {session_id}")
-            
-            # 使用获取或生成的session_id调用SessionManager的send_message方法
-            try:
-                response = session_manager.send_message(session_id, GetMSG)
-                logger.info(f"消息处理成功，会话ID: {session_id}")
-                return jsonify(response)
-            except Exception as e:
-                logger.error(f"SessionManager处理消息时出错: {e}")
-                return jsonify({"error": f"处理消息时出错: {str(e)}"})
+            client_ip = request.client.host if request.client else ''
+            # SessionManager是同步实现，放到线程中执行，避免阻塞事件循环
+            return await asyncio.to_thread(handle_session_message, GetMSG, client_ip)
         else:
             logger.info("接收到GET请求")
-            return 'defeat'
+            return PlainTextResponse('defeat')
     except Exception as e:
         logger.error(f"处理请求时出错: {e}")
-        return jsonify({"error": f"服务器内部错误: {str(e)}"})
+        return {"error": f"服务器内部错误: {str(e)}"}
+
+def handle_session_message(GetMSG, client_ip):
+    """
+    基于客户端IP获取或创建会话，并使用SessionManager处理消息
+    
+    Args:
+        GetMSG: 用户消息
+        client_ip: 客户端IP地址
+        
+    Returns:
+        str or dict: 大模型回复内容，出错时返回包含error的字典
+    """
+    logger.info(f"接收到消息: {GetMSG[:100]}..." if len(GetMSG) > 100 else f"接收到消息: {GetMSG}")
+    
+    # 检查SessionManager是否初始化成功
+    if session_manager is None:
+        logger.error("SessionManager未初始化，无法处理请求")
+        return {"error": "服务未初始化，请稍后再试"}
+    
+    logger.info(f"客户端IP地址: {client_ip}")
+    
+    # 线程安全地获取或生成session_id
+    with ip_session_lock:
+        if client_ip in ip_session_map:
+            session_id = ip_session_map[client_ip]
+            logger.info(f"IP {client_ip} 已存在会话: {session_id}")
+        else:
+            # 生成新的session_id
+            # 使用UUID结合时间戳和IP地址生成唯一且安全的session_id
+            # session_id = f"session_{uuid.uuid4()}_{int(time.time())}_{hash(client_ip) % 10000}"
+            session_id = session_manager.create_session()
+            ip_session_map[client_ip] = session_id
+            logger.info(f"为IP {client_ip} 创建新会话: {session_id}")
+    
+    # 使用获取或生成的session_id调用SessionManager的send_message方法
+    try:
+        response = session_manager.send_message(session_id, GetMSG)
+        logger.info(f"消息处理成功，会话ID: {session_id}")
+        return response
+    except Exception as e:
+        logger.error(f"SessionManager处理消息时出错: {e}")
+        return {"error": f"处理消息时出错: {str(e)}"}
 
 if __name__ == '__main__':
-    # 运行Flask应用
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    # 运行ASGI应用
+    uvicorn.run(app, host='0.0.0.0', port=5000)
     # 以下是测试代码，如需测试可取消注释
     # vectorstore = get_chroma_vectorstore()
     # search_results = search_relevant_info_in_chroma("精排模型的转化率提升了多少？", vectorstore, return_scores=True)
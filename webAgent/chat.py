@@ -1,8 +1,10 @@
 import os
 import json
+import time
+import atexit
+import threading
 import dotenv
 from datetime import datetime
-from flask import request
 from langgraph.graph import StateGraph, START
 # from langgraph.runtime import LangGraphRunnable
 from langchain_community.chat_models import ChatZhipuAI
@@ -24,6 +26,10 @@ logger = logging.getLogger(__name__)
 # 加载环境变量
 dotenv.load_dotenv('../.env')
 
+# 会话文件中消息类型以下标存储
+MESSAGE_TYPES = (HumanMessage, AIMessage, SystemMessage)
+MESSAGE_TYPE_IDS = {cls.__name__: i for i, cls in enumerate(MESSAGE_TYPES)}
+
 
 class SessionManager:
     """
@@ -50,10 +56,19 @@ class SessionManager:
         self.model_name = model_name
         self.session_dir = session_dir
         self.system_prompt = system_prompt or "你是一个专业的AI助手，能够友好、准确地回答用户的问题。"
+        # 系统提示在实例生命周期内不变，只创建一次消息对象
+        self._system_msg = SystemMessage(content=self.system_prompt) if self.system_prompt else None
         
         # 创建会话存储目录
         os.makedirs(self.session_dir, exist_ok=True)
         
+        # 已保存到文件的会话ID索引（包括旧版.json格式），启动时扫描一次，之后随创建/删除更新
+        self._known_sessions = set()
+        for file in os.listdir(self.session_dir):
+            session_id, ext = os.path.splitext(file)
+            if ext in ('.jsonl', '.json'):
+                self._known_sessions.add(session_id)
+        
         # 初始化大模型
         self.llm = self._initialize_llm()
         
@@ -66,6 +81,25 @@ class SessionManager:
         # 存储活跃会话
         self.active_sessions = {}
         
+        # 状态图定义与会话无关，编译一次后所有会话共用
+        self._graph = self._create_graph()
+        
+        # 会话持久化：保存时只标记为待写入，由后台线程定期合并写盘
+        self._dirty = set()
+        self._session_cache = {}
+        # 每个会话已写入文件的消息条数，为None（不存在）时需要重写整个文件
+        self._persisted_counts = {}
+        # 每个会话的字符串表（字符串 -> 编号），追加写入时继续沿用
+        self._intern = {}
+        self._flush_interval = 2.0
+        self._dirty_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._flush_thread = threading.Thread(target=self._flush_loop, daemon=True)
+        self._flush_thread.start()
+        # 进程退出前写入所有未保存的会话
+        atexit.register(self.flush)
+        
     def _initialize_llm(self):
         """
         初始化大模型
@@ -158,41 +192,31 @@ class SessionManager:
             """
             处理消息节点
             """
+            # 历史消息列表，回复直接追加到该列表中，避免每轮复制整个历史
+            history = state["messages"]
+            
+            # 构建消息列表，包括系统提示和历史消息
+            messages = [self._system_msg] if self._system_msg else []
+            messages.extend(history)
+            
+            # 调用大模型生成回复
             try:
-                # 确保state是字典格式
-                if not isinstance(state, dict):
-                    # 如果不是字典，尝试转换为字典
-                    state = dict(state)
-                
-                # 构建消息列表，包括系统提示和历史消息
-                messages = []
-                
-                # 添加系统提示
-                if self.system_prompt:
-                    messages.append(SystemMessage(content=self.system_prompt))
-                
-                # 添加历史消息
-                messages.extend(state.get("messages", []))
-                
-                # 调用大模型生成回复
                 response = self.llm.invoke(messages)
-                
-                # 更新状态
-                new_state = state.copy() if hasattr(state, 'copy') else dict(state)
-                new_state["messages"] = state.get("messages", []) + [response]
-                
-                # 保存会话
-                session_id = state.get("session_id", "")
-                if session_id:
-                    self._save_session(session_id, new_state["messages"])
-                
-                return new_state
             except Exception as e:
                 print(f"处理消息时出错: {e}")
-                # 创建错误状态
-                error_state = state.copy() if hasattr(state, 'copy') else dict(state)
-                error_state["messages"] = state.get("messages", []) + [AIMessage(content=f"抱歉，处理您的请求时出错: {e}")]
-                return error_state
+                response = AIMessage(content=f"抱歉，处理您的请求时出错: {e}")
+            
+            # 更新状态
+            new_state = state.copy()
+            history.append(response)
+            new_state["messages"] = history
+            
+            # 保存会话
+            session_id = state.get("session_id", "")
+            if session_id:
+                self._save_session(session_id, history)
+            
+            return new_state
         
         # 创建状态图 - 使用字典作为状态类型
         # 对于langgraph，我们可以直接使用dict作为状态类型
@@ -213,18 +237,22 @@ class SessionManager:
             str: 会话ID
         """
         if not session_id:
-            # 自动生成会话ID
-            session_id = f"session_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}"
+            # 自动生成会话ID（纳秒时间戳的十六进制形式）
+            session_id = f"session_{time.time_ns():x}"
         
         # 初始化会话状态
+        created_at = datetime.now().isoformat()
         self.active_sessions[session_id] = {
             "messages": [],
-            "created_at": datetime.now().isoformat(),
-            "graph": self._create_graph()
+            "created_at": created_at
         }
         
-        # 保存空会话
+        # 保存空会话（新会话需要重写文件）
+        self._persisted_counts.pop(session_id, None)
+        self._intern.pop(session_id, None)
         self._save_session(session_id, [])
+        self._save_session_meta(session_id, {"created_at": created_at})
+        self._known_sessions.add(session_id)
         
         print(f"创建新会话: {session_id}")
         return session_id
@@ -248,13 +276,15 @@ class SessionManager:
             
             # 检查会话是否存在
             if session_id not in self.active_sessions:
-                # 尝试从文件加载会话
-                session_data = self._load_session(session_id)
-                if session_data:
+                if self._session_file_exists(session_id):
+                    # 从文件加载会话；文件无法解析时不重建会话，避免覆盖已有历史
+                    session_data = self._load_session(session_id)
+                    if session_data is None:
+                        return "抱歉，会话记录读取失败，请稍后重试。"
+                    meta = self._load_session_meta(session_id)
                     self.active_sessions[session_id] = {
                         "messages": session_data,
-                        "created_at": datetime.now().isoformat(),
-                        "graph": self._create_graph()
+                        "created_at": meta.get("created_at") or datetime.now().isoformat()
                     }
                 else:
                     # 创建新会话
@@ -271,7 +301,7 @@ class SessionManager:
             chat_prompt = create_search_prompt(role,message,search_results)
             # 正确处理chat_prompt.format_messages()的返回值
             # format_messages返回的是消息对象列表，我们需要获取其内容
-            formatted_messages = chat_prompt.format_messages(user_question=message, search_results=search_results)
+            formatted_messages = chat_prompt.format_messages(user_question=message)
             # 构建一个包含所有消息内容的字符串
             prompt_content = ""
             for msg in formatted_messages:
@@ -288,15 +318,17 @@ class SessionManager:
             }
             
             # 调用graph执行prompt，获取回复，并保存历史信息
-            result = session["graph"].invoke(state)
+            # 回复由处理节点直接追加到会话的消息列表中
+            result = self._graph.invoke(state)
+            messages = session["messages"]
             
-            # 更新会话状态
-            # self.active_sessions[session_id]["messages"] = result["messages"]
-            self.active_sessions[session_id]["messages"].append(result["messages"][-1])
+            # 状态图返回了新列表时才需要同步回会话
+            if result["messages"] is not messages:
+                messages.append(result["messages"][-1])
             
             # 返回最新的AI回复
-            if result["messages"] and isinstance(result["messages"][-1], AIMessage):
-                return result["messages"][-1].content
+            if messages and isinstance(messages[-1], AIMessage):
+                return messages[-1].content
             else:
                 return "抱歉，未能生成回复。"
                 
@@ -350,39 +382,173 @@ class SessionManager:
                 return self.active_sessions[session_id]["messages"]
             else:
                 # 尝试从文件加载
-                return self._load_session(session_id)
+                return self._load_session(session_id) or []
         except Exception as e:
             print(f"获取历史记录时出错: {e}")
             return []
     
     def _save_session(self, session_id, messages):
         """
-        保存会话到文件
+        保存会话（标记为待写入，由后台线程合并写盘）
         
         Args:
             session_id: 会话ID
             messages: 消息列表
         """
-        try:
-            # 转换消息为可序列化格式
-            serializable_messages = []
-            for msg in messages:
-                msg_dict = {
-                    "type": msg.__class__.__name__,
-                    "content": msg.content,
-                    "additional_kwargs": msg.additional_kwargs,
-                    "response_metadata": msg.response_metadata
+        with self._dirty_lock:
+            self._session_cache[session_id] = messages
+            self._dirty.add(session_id)
+    
+    def _flush_loop(self):
+        """
+        后台线程：每隔_flush_interval秒写入一次待保存的会话
+        """
+        while not self._stop_event.wait(self._flush_interval):
+            self.flush()
+    
+    def flush(self):
+        """
+        立即将所有待保存的会话写入文件
+        """
+        # 串行化写盘，避免并发flush时旧数据覆盖新数据
+        with self._write_lock:
+            with self._dirty_lock:
+                pending = {
+                    session_id: self._session_cache.pop(session_id)
+                    for session_id in self._dirty
+                    if session_id in self._session_cache
                 }
-                serializable_messages.append(msg_dict)
+                self._dirty.clear()
+            
+            for session_id, messages in pending.items():
+                self._write_session(session_id, messages)
+    
+    def _session_path(self, session_id, suffix=".jsonl"):
+        """
+        获取会话文件路径
+        
+        Args:
+            session_id: 会话ID
+            suffix: 文件后缀，.jsonl为消息日志，.meta为元数据，.json为旧版格式
             
-            # 保存到文件
-            session_file = os.path.join(self.session_dir, f"{session_id}.json")
-            with open(session_file, 'w', encoding='utf-8') as f:
-                json.dump(serializable_messages, f, ensure_ascii=False, indent=2)
+        Returns:
+            str: 文件路径
+        """
+        return os.path.join(self.session_dir, f"{session_id}{suffix}")
+    
+    def _session_file_exists(self, session_id):
+        """
+        判断会话是否已有文件（包括旧版.json格式）
+        
+        Args:
+            session_id: 会话ID
+            
+        Returns:
+            bool: 是否存在会话文件
+        """
+        return (os.path.exists(self._session_path(session_id))
+                or os.path.exists(self._session_path(session_id, ".json")))
+    
+    def _write_session(self, session_id, messages):
+        """
+        将会话写入JSON Lines文件
+        
+        文件由两种行组成：JSON字符串行向字符串表追加一项，
+        [类型编号, 内容编号, additional_kwargs编号, response_metadata编号] 行表示一条消息。
+        重复的内容和元数据只保存一次；多模态消息的列表内容不进入字符串表，直接写在消息行中。
+        已写入过的会话只追加新增的消息；新会话或从旧版格式迁移的会话重写整个文件
+        
+        Args:
+            session_id: 会话ID
+            messages: 消息列表
+        """
+        try:
+            # messages是会话正在使用的列表，请求线程可能同时追加消息；
+            # 先取定本次写入的范围，只写入并记录这一段
+            end = len(messages)
+            persisted = self._persisted_counts.get(session_id)
+            if persisted is None:
+                mode, new_messages = 'w', messages[:end]
+                table = {}
+            else:
+                mode, new_messages = 'a', messages[persisted:end]
+                if not new_messages:
+                    return
+                table = self._intern.setdefault(session_id, {})
+            
+            lines = []
+            
+            def intern(value):
+                # 新字符串先写入字符串表再被引用
+                index = table.get(value)
+                if index is None:
+                    index = table[value] = len(table)
+                    lines.append(json.dumps(value, ensure_ascii=False) + "\n")
+                return index
+            
+            for msg in new_messages:
+                type_id = MESSAGE_TYPE_IDS.get(msg.__class__.__name__)
+                if type_id is None:
+                    continue
+                # 列表内容（多模态消息）无法作为字符串表的键，原样写入消息行
+                content = msg.content if isinstance(msg.content, list) else intern(msg.content)
+                record = [
+                    type_id,
+                    content,
+                    intern(json.dumps(msg.additional_kwargs, ensure_ascii=False, sort_keys=True, separators=(',', ':'))),
+                    intern(json.dumps(msg.response_metadata, ensure_ascii=False, sort_keys=True, separators=(',', ':')))
+                ]
+                lines.append(json.dumps(record, separators=(',', ':')) + "\n")
+            
+            # 保存到文件：追加时直接写入；重写整个文件时先写临时文件再原子替换
+            session_file = self._session_path(session_id)
+            if mode == 'a':
+                with open(session_file, 'a', encoding='utf-8') as f:
+                    f.writelines(lines)
+            else:
+                tmp_file = session_file + ".tmp"
+                with open(tmp_file, 'w', encoding='utf-8') as f:
+                    f.writelines(lines)
+                os.replace(tmp_file, session_file)
+            self._intern[session_id] = table
+            self._persisted_counts[session_id] = end
                 
         except Exception as e:
+            # 字符串表可能已与文件不一致，下次保存时重写整个文件
+            self._intern.pop(session_id, None)
+            self._persisted_counts.pop(session_id, None)
             print(f"保存会话时出错: {e}")
     
+    def _save_session_meta(self, session_id, meta):
+        """
+        保存会话元数据（如创建时间）
+        
+        Args:
+            session_id: 会话ID
+            meta: 元数据字典
+        """
+        try:
+            with open(self._session_path(session_id, ".meta"), 'w', encoding='utf-8') as f:
+                json.dump(meta, f, ensure_ascii=False, separators=(',', ':'))
+        except Exception as e:
+            print(f"保存会话元数据时出错: {e}")
+    
+    def _load_session_meta(self, session_id):
+        """
+        加载会话元数据
+        
+        Args:
+            session_id: 会话ID
+            
+        Returns:
+            dict: 元数据字典，不存在时返回空字典
+        """
+        try:
+            with open(self._session_path(session_id, ".meta"), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    
     def _load_session(self, session_id):
         """
         从文件加载会话
@@ -391,52 +557,69 @@ class SessionManager:
             session_id: 会话ID
             
         Returns:
-            list: 消息列表
+            list: 消息列表，文件存在但无法解析时返回None
         """
         try:
-            session_file = os.path.join(self.session_dir, f"{session_id}.json")
-            if not os.path.exists(session_file):
-                return []
-            
-            # 从文件加载
-            with open(session_file, 'r', encoding='utf-8') as f:
-                serializable_messages = json.load(f)
-            
-            # 转换为消息对象
+            session_file = self._session_path(session_id)
+            legacy_file = self._session_path(session_id, ".json")
             messages = []
-            for msg_dict in serializable_messages:
-                msg_type = msg_dict["type"]
-                content = msg_dict["content"]
-                additional_kwargs = msg_dict.get("additional_kwargs", {})
-                response_metadata = msg_dict.get("response_metadata", {})
+            if os.path.exists(session_file):
+                # 逐行读取：字符串行加入字符串表，数组行按编号还原消息
+                strings = []
+                with open(session_file, 'r', encoding='utf-8') as f:
+                    lines = f.readlines()
+                # 追加写入时进程中断会留下不完整的最后一行（无法解析或缺少换行）：
+                # 无法解析的最后一行直接忽略，并在下次保存时重写整个文件
+                torn = bool(lines) and not lines[-1].endswith("\n")
+                for i, line in enumerate(lines):
+                    if not line.strip():
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        if i == len(lines) - 1:
+                            torn = True
+                            break
+                        raise
+                    if isinstance(record, str):
+                        strings.append(record)
+                        continue
+                    type_id, content_id, kwargs_id, metadata_id = record
+                    messages.append(MESSAGE_TYPES[type_id](
+                        content=content_id if isinstance(content_id, list) else strings[content_id],
+                        additional_kwargs=json.loads(strings[kwargs_id]),
+                        response_metadata=json.loads(strings[metadata_id])
+                    ))
                 
-                if msg_type == "HumanMessage":
-                    msg = HumanMessage(
-                        content=content,
-                        additional_kwargs=additional_kwargs,
-                        response_metadata=response_metadata
-                    )
-                elif msg_type == "AIMessage":
-                    msg = AIMessage(
-                        content=content,
-                        additional_kwargs=additional_kwargs,
-                        response_metadata=response_metadata
-                    )
-                elif msg_type == "SystemMessage":
-                    msg = SystemMessage(
-                        content=content,
-                        additional_kwargs=additional_kwargs
-                    )
+                if torn:
+                    print(f"会话文件末尾存在不完整的记录，已忽略: {session_id}")
+                    self._intern.pop(session_id, None)
+                    self._persisted_counts.pop(session_id, None)
                 else:
-                    continue
-                
-                messages.append(msg)
+                    # 记录文件中已有的消息条数和字符串表，之后只追加新内容
+                    self._intern[session_id] = {value: i for i, value in enumerate(strings)}
+                    self._persisted_counts[session_id] = len(messages)
+            elif os.path.exists(legacy_file):
+                # 兼容旧版的整体JSON格式，下次保存时迁移为新格式
+                with open(legacy_file, 'r', encoding='utf-8') as f:
+                    serializable_messages = json.load(f)
+                for msg_dict in serializable_messages:
+                    type_id = MESSAGE_TYPE_IDS.get(msg_dict["type"])
+                    if type_id is None:
+                        continue
+                    messages.append(MESSAGE_TYPES[type_id](
+                        content=msg_dict["content"],
+                        additional_kwargs=msg_dict.get("additional_kwargs", {}),
+                        response_metadata=msg_dict.get("response_metadata", {})
+                    ))
+                self._intern.pop(session_id, None)
+                self._persisted_counts.pop(session_id, None)
             
             return messages
             
         except Exception as e:
             print(f"加载会话时出错: {e}")
-            return []
+            return None
     
     def list_sessions(self):
         """
@@ -446,16 +629,11 @@ class SessionManager:
             list: 会话ID列表
         """
         try:
-            sessions = []
             # 从活跃会话中获取
-            sessions.extend(self.active_sessions.keys())
+            sessions = list(self.active_sessions)
             
-            # 从文件中获取
-            for file in os.listdir(self.session_dir):
-                if file.endswith('.json'):
-                    session_id = file[:-5]  # 移除.json后缀
-                    if session_id not in sessions:
-                        sessions.append(session_id)
+            # 从已保存会话的索引中获取
+            sessions.extend(self._known_sessions.difference(self.active_sessions))
             
             return sessions
         except Exception as e:
@@ -477,10 +655,21 @@ class SessionManager:
             if session_id in self.active_sessions:
                 del self.active_sessions[session_id]
             
+            # 丢弃尚未写盘的数据，避免删除后被后台线程重新写入
+            with self._write_lock:
+                with self._dirty_lock:
+                    self._dirty.discard(session_id)
+                    self._session_cache.pop(session_id, None)
+            
+            self._persisted_counts.pop(session_id, None)
+            self._intern.pop(session_id, None)
+            self._known_sessions.discard(session_id)
+            
             # 从文件中删除
-            session_file = os.path.join(self.session_dir, f"{session_id}.json")
-            if os.path.exists(session_file):
-                os.remove(session_file)
+            for suffix in ('.jsonl', '.meta', '.json'):
+                session_file = self._session_path(session_id, suffix)
+                if os.path.exists(session_file):
+                    os.remove(session_file)
             
             print(f"删除会话: {session_id}")
             return True
@@ -28,10 +28,40 @@ def create_prompt(role,user_question):
     ])
     return chat_prompt
 
+def format_search_results(search_results):
+    """
+    将搜索结果整理为编号列表文本
+    
+    Args:
+        search_results: 本地数据的(内容, 分数)列表，或TavilySearch返回的结果
+        
+    Returns:
+        str: 每条结果一段的文本
+    """
+    # TavilySearch返回包含results列表的字典
+    if isinstance(search_results, dict):
+        search_results = search_results.get("results", [])
+    if isinstance(search_results, str):
+        return search_results
+    
+    lines = []
+    for i, item in enumerate(search_results, 1):
+        if isinstance(item, dict):
+            # 网页数据：标题 - 来源，下一行为内容
+            lines.append(f"{i}. {item.get('title', '')} - {item.get('url', '')}\n{item.get('content', '')}")
+        elif isinstance(item, tuple):
+            # 本地数据：(内容, 相似度分数)
+            lines.append(f"{i}. {item[0]}")
+        else:
+            lines.append(f"{i}. {item}")
+    return "\n".join(lines)
+
 def create_search_prompt(role, user_question, search_results):
     """
     将用户问题和搜索结果合并成一条标准的ChatPromptTemplate大语言模型提示词
     
+    搜索结果在此处直接拼接进系统消息，格式化时只需填入用户问题
+    
     Args:
         role: 用户需要的职业人士
         user_question: 用户的问题
@@ -41,10 +71,10 @@ def create_search_prompt(role, user_question, search_results):
         ChatPromptTemplate: 合并后的提示词模板
     """
     # 构建系统消息
-    system_message = SystemMessagePromptTemplate.from_template(
-        f"你是一个专业的{role}，需要根据用户的问题和提供的搜索结果来生成详细、准确的回答。\n"
+    system_message = SystemMessage(
+        content=f"你是一个专业的{role}，需要根据用户的问题和提供的搜索结果来生成详细、准确的回答。\n"
         "请参考以下搜索结果：\n"
-        "{search_results}\n"
+        f"{format_search_results(search_results)}\n"
         "回答时要：\n"
         "1. 基于搜索结果提供准确的信息\n"
         "2. 保持回答的连贯性和逻辑性\n"
@@ -28,8 +28,8 @@ def search_relevant_info(user_question):
         print(f"搜索过程中出错: {e}")
         return []
 
-# 使用max_marginal_relevance_search函数在chroma向量数据库中搜索与query相关性最高的3条向量
-def search_relevant_info_in_chroma(query, vectorstore, k=3, return_scores=False):
+# 在chroma向量数据库中搜索与query相关性最高的3条向量，需要结果多样性时可使用max_marginal_relevance_search
+def search_relevant_info_in_chroma(query, vectorstore, k=3, return_scores=False, use_mmr=False):
     """
     在Chroma向量数据库中搜索与query相关性最高的k条向量
     
@@ -38,6 +38,7 @@ def search_relevant_info_in_chroma(query, vectorstore, k=3, return_scores=False)
         vectorstore: Chroma向量数据库实例
         k: 返回的向量数量，默认3条
         return_scores: 是否返回相似度分数，默认False
+        use_mmr: 是否使用最大边际相关性(MMR)重排以提高结果多样性，默认False，仅在return_scores为False时生效
         
     Returns:
         list: 包含k条相关性最高的向量文档
@@ -60,14 +61,21 @@ def search_relevant_info_in_chroma(query, vectorstore, k=3, return_scores=False)
                     "similarity_score": score
                 })
             return formatted_results
-        else:
-            # 保持向后兼容，只返回文档
+        elif use_mmr:
+            # 只返回文档，经MMR重排
             search_results = vectorstore.max_marginal_relevance_search(
                 query=query,
                 k=k,
                 fetch_k=20  # 先获取20条向量，再筛选出k条
             )
             return search_results
+        else:
+            # 只返回文档，直接按相似度取前k条
+            search_results = vectorstore.similarity_search(
+                query=query,
+                k=k
+            )
+            return search_results
     except Exception as e:
         print(f"在Chroma数据库中搜索时出错: {e}")
         return []
@@ -12,10 +12,30 @@ from typing import Dict, List, Tuple, Optional
 # import fcntl
 import threading
 from datetime import datetime
-from flask import Request
+from fastapi import Request
+
+# 缓存已加载的向量数据库，避免每次查询都重新打开（进程内唯一实例）
+_VSTORE = None
+_VSTORE_LOCK = threading.Lock()
+
+def get_vectorstore():
+    """
+    获取进程内共用的Chroma向量数据库实例，首次调用时加载
+    
+    Returns:
+        向量数据库实例，加载失败时返回None（下次调用时重试）
+    """
+    global _VSTORE
+    if _VSTORE is None:
+        # 加锁避免多个线程同时首次调用时重复加载
+        with _VSTORE_LOCK:
+            if _VSTORE is None:
+                # 加载失败时返回None，下次调用时重试
+                _VSTORE = get_chroma_vectorstore()
+    return _VSTORE
 
 def getInfo(query):
-    vectorstore = get_chroma_vectorstore()
+    vectorstore = get_vectorstore()
     # 从Chroma数据库中搜索与用户问题相关性最高的3条向量
     search_info = search_relevant_info_in_chroma(query, vectorstore, return_scores=True)
     threshold = 1.0
@@ -31,7 +51,7 @@ def getInfo(query):
                 if score <= threshold:
                     search_results.append((item['content'], score))
     
-    if len(search_results) == 0:
+    if not search_results:
         print("========本地数据不符合要求，使用网页数据======")
         search_results = search_relevant_info(query)
     
@@ -52,7 +72,7 @@ def extract_client_ip(request: Request) -> str:
         # 取第一个IP
         ip = x_forwarded_for.split(',')[0].strip()
     else:
-        ip = request.remote_addr or ''
+        ip = request.client.host if request.client else ''
     return ip
 
 
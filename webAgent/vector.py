@@ -1,5 +1,13 @@
 import os
+import uuid
+import asyncio
+import sqlite3
+import hashlib
+import threading
 import dotenv
+from array import array
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 from langchain_community.document_loaders import PyPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_ollama import OllamaEmbeddings
@@ -8,6 +16,232 @@ from langchain_chroma import Chroma
 # 加载环境变量
 dotenv.load_dotenv('../.env')
 
+# 并行读取PDF文件的最大线程数
+MAX_PDF_WORKERS = 8
+
+# 每批写入Chroma的文本片段数量
+EMBED_BATCH_SIZE = 64
+
+# 同时向Ollama发送的嵌入请求数，过大可能导致Ollama显存不足
+EMBED_CONCURRENCY = 4
+
+# 嵌入向量磁盘缓存，以模型名和文本内容的哈希为键，重复入库时跳过未变化的文本片段
+EMBEDDING_CACHE_PATH = "./emb_cache.sqlite3"
+
+# 文本切分器（无状态，所有调用和线程共用）
+# chunk_size: 每个文本片段的大小，片段越大需要嵌入的片段越少
+# chunk_overlap: 片段之间的重叠部分大小，有助于保持上下文连续性
+# 长度计算使用默认的len函数
+text_splitter = RecursiveCharacterTextSplitter(
+    chunk_size=1500,       # 每个片段1500个字符
+    chunk_overlap=150      # 重叠150个字符
+)
+
+# 嵌入缓存数据库连接由所有线程共用，读写时加锁
+_embedding_cache_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def _get_cache_connection(cache_path):
+    """
+    打开嵌入缓存数据库，每个路径只打开一次并建表
+    
+    Args:
+        cache_path: 数据库文件路径
+        
+    Returns:
+        sqlite3.Connection: 数据库连接
+    """
+    conn = sqlite3.connect(cache_path, check_same_thread=False)
+    conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)")
+    conn.commit()
+    return conn
+
+
+class CachedOllamaEmbeddings(OllamaEmbeddings):
+    """
+    带磁盘缓存的Ollama嵌入模型
+    
+    embed_documents先按文本内容查询SQLite缓存，只把未命中的文本发送给Ollama，
+    并将新结果写回缓存。查询语句（embed_query）各不相同，直接请求Ollama，不读写缓存。
+    """
+    
+    cache_path: str = EMBEDDING_CACHE_PATH
+    
+    def _cache_key(self, text):
+        """
+        计算文本的缓存键
+        
+        Args:
+            text: 文本内容
+            
+        Returns:
+            str: 模型名和文本内容的BLAKE2b哈希
+        """
+        return hashlib.blake2b(f"{self.model}\0{text}".encode("utf-8"), digest_size=16).hexdigest()
+    
+    def _read_cached_vectors(self, keys):
+        """
+        从缓存中读取嵌入向量
+        
+        Args:
+            keys: 缓存键列表
+            
+        Returns:
+            dict: 命中的缓存键到向量的映射
+        """
+        cached = {}
+        try:
+            conn = _get_cache_connection(self.cache_path)
+            with _embedding_cache_lock:
+                # 分段查询，避免超出SQLite的参数个数限制
+                for i in range(0, len(keys), 500):
+                    part = keys[i:i + 500]
+                    rows = conn.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(part))})",
+                        part
+                    )
+                    for key, blob in rows:
+                        cached[key] = array('d', blob).tolist()
+        except sqlite3.Error as e:
+            print(f"读取嵌入缓存失败: {e}")
+        return cached
+    
+    def _write_cached_vectors(self, vectors):
+        """
+        将嵌入向量写入缓存
+        
+        Args:
+            vectors: 缓存键到向量的映射
+        """
+        try:
+            conn = _get_cache_connection(self.cache_path)
+            with _embedding_cache_lock, conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                    [(key, array('d', vector).tobytes()) for key, vector in vectors.items()]
+                )
+        except sqlite3.Error as e:
+            print(f"写入嵌入缓存失败: {e}")
+    
+    def _lookup(self, texts):
+        """
+        查询文本的缓存情况
+        
+        Args:
+            texts: 文本列表
+            
+        Returns:
+            tuple: (缓存键列表, 命中的向量映射, 未命中的缓存键到文本的映射)
+                   同一批中重复的文本只计算一次
+        """
+        keys = [self._cache_key(text) for text in texts]
+        vectors = self._read_cached_vectors(keys)
+        missing = {key: text for key, text in zip(keys, texts) if key not in vectors}
+        return keys, vectors, missing
+    
+    def embed_documents(self, texts):
+        """
+        计算文本片段的嵌入向量，优先使用缓存
+        
+        Args:
+            texts: 文本列表
+            
+        Returns:
+            list: 与texts一一对应的嵌入向量列表
+        """
+        keys, vectors, missing = self._lookup(texts)
+        if missing:
+            new_vectors = dict(zip(missing, super().embed_documents(list(missing.values()))))
+            self._write_cached_vectors(new_vectors)
+            vectors.update(new_vectors)
+        
+        return [vectors[key] for key in keys]
+    
+    async def aembed_documents(self, texts):
+        """
+        异步计算文本片段的嵌入向量，优先使用缓存
+        
+        Args:
+            texts: 文本列表
+            
+        Returns:
+            list: 与texts一一对应的嵌入向量列表
+        """
+        # 缓存读写是阻塞调用，放到线程中执行，不阻塞其他批次的请求
+        keys, vectors, missing = await asyncio.to_thread(self._lookup, texts)
+        if missing:
+            new_vectors = dict(zip(missing, await super().aembed_documents(list(missing.values()))))
+            await asyncio.to_thread(self._write_cached_vectors, new_vectors)
+            vectors.update(new_vectors)
+        
+        return [vectors[key] for key in keys]
+    
+    def embed_query(self, text):
+        """
+        计算查询语句的嵌入向量（不使用缓存）
+        
+        Args:
+            text: 查询语句
+            
+        Returns:
+            list: 嵌入向量
+        """
+        return super().embed_documents([text])[0]
+    
+    async def aembed_query(self, text):
+        """
+        异步计算查询语句的嵌入向量（不使用缓存）
+        
+        Args:
+            text: 查询语句
+            
+        Returns:
+            list: 嵌入向量
+        """
+        return (await super().aembed_documents([text]))[0]
+
+
+def _create_embeddings():
+    """
+    创建新的嵌入模型实例
+    
+    Returns:
+        CachedOllamaEmbeddings: 带磁盘缓存的嵌入模型实例
+    """
+    return CachedOllamaEmbeddings(
+        model="qwen3-embedding:0.6b",       # 确保这个模型已在 Ollama 中 pull 过
+        base_url="http://localhost:11434",  # 正确写法：不要加 /v1
+        # api_key="ollama",  # 如需要兼容某些接口可保留
+    )
+
+
+@lru_cache(maxsize=1)
+def _get_embeddings():
+    """
+    获取共用的嵌入模型，首次调用时创建，之后复用同一实例及其HTTP客户端（仅用于同步调用）
+    
+    Returns:
+        CachedOllamaEmbeddings: 带磁盘缓存的嵌入模型实例
+    """
+    return _create_embeddings()
+
+
+def _load_and_split(pdf_file):
+    """
+    读取单个PDF文件并完成文本切分（在线程池中执行）
+    
+    Args:
+        pdf_file: PDF文件路径
+        
+    Returns:
+        tuple: (页数, 切分后的文本片段列表)
+    """
+    # 读取PDF文件，提取所有页面的文本
+    docs = PyPDFLoader(pdf_file).load()
+    # 文本切分
+    return len(docs), text_splitter.split_documents(docs)
+
 
 def read_pdf_and_split(pdf_path):
     """
@@ -49,40 +283,26 @@ def read_pdf_and_split(pdf_path):
                 print(f"文件不是PDF格式: {pdf_path}")
                 return []
         
-        # 配置文本切分器
-        # chunk_size: 每个文本片段的大小
-        # chunk_overlap: 片段之间的重叠部分大小，有助于保持上下文连续性
-        # length_function: 用于计算文本长度的函数
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,       # 每个片段1000个字符
-            chunk_overlap=200,      # 重叠200个字符
-            length_function=len     # 使用Python内置的len函数计算长度
-        )
-        
-        # 处理每个PDF文件
+        # 多个PDF文件在线程池中并行读取和切分，按原顺序汇总结果
         total_files_processed = 0
-        for pdf_file in pdf_files:
-            try:
-                print(f"\n正在处理文件: {os.path.basename(pdf_file)}")
-                # 读取PDF文件
-                loader = PyPDFLoader(pdf_file)
-                
-                # 提取所有页面的文本
-                docs = loader.load()
-                print(f"  提取到 {len(docs)} 页文本")
-                
-                # 文本切分
-                chunks = text_splitter.split_documents(docs)
-                print(f"  切分完成，得到 {len(chunks)} 个文本片段")
-                
-                # 将切分结果添加到总列表
-                combined_chunks.extend(chunks)
-                total_files_processed += 1
-                
-            except Exception as e:
-                print(f"  处理文件 {os.path.basename(pdf_file)} 时出错: {e}")
-                # 继续处理下一个文件
-                continue
+        max_workers = min(MAX_PDF_WORKERS, os.cpu_count() or 1, len(pdf_files))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(_load_and_split, pdf_file) for pdf_file in pdf_files]
+            for pdf_file, future in zip(pdf_files, futures):
+                try:
+                    print(f"\n正在处理文件: {os.path.basename(pdf_file)}")
+                    page_count, chunks = future.result()
+                    print(f"  提取到 {page_count} 页文本")
+                    print(f"  切分完成，得到 {len(chunks)} 个文本片段")
+                    
+                    # 将切分结果添加到总列表
+                    combined_chunks.extend(chunks)
+                    total_files_processed += 1
+                    
+                except Exception as e:
+                    print(f"  处理文件 {os.path.basename(pdf_file)} 时出错: {e}")
+                    # 继续处理下一个文件
+                    continue
         
         # 输出处理结果
         print(f"\nPDF文件处理完成:")
@@ -107,12 +327,8 @@ def vectorize_text(text_chunks):
         list: 向量化后的文本片段列表
     """
     try:
-        # 初始化嵌入模型
-        embeddings = OllamaEmbeddings(
-            model="qwen3-embedding:0.6b",       # 确保这个模型已在 Ollama 中 pull 过
-            base_url="http://localhost:11434",  # 正确写法：不要加 /v1
-            # api_key="ollama",  # 如需要兼容某些接口可保留
-        )
+        # 获取嵌入模型
+        embeddings = _get_embeddings()
         
         print("文本向量化中...")
         # 注意：这里我们不直接计算嵌入，而是返回文本片段，
@@ -123,6 +339,35 @@ def vectorize_text(text_chunks):
         return []
 
 
+async def _embed_and_add_batches(vectorstore, embeddings, batches):
+    """
+    并发计算多批文本片段的嵌入向量，并直接写入Chroma集合
+    
+    每批只向Ollama发送一次嵌入请求，最多同时进行EMBED_CONCURRENCY批；
+    向量已预先算好，写入时不再经过Chroma的嵌入函数
+    
+    Args:
+        vectorstore: Chroma向量数据库实例
+        embeddings: 嵌入模型
+        batches: 文本片段（Document）批次列表
+    """
+    semaphore = asyncio.Semaphore(EMBED_CONCURRENCY)
+    
+    async def embed_and_add(batch):
+        async with semaphore:
+            vectors = await embeddings.aembed_documents([doc.page_content for doc in batch])
+        # 写入Chroma是阻塞调用，放到线程中执行
+        await asyncio.to_thread(
+            vectorstore._collection.add,
+            ids=[str(uuid.uuid4()) for _ in batch],
+            embeddings=vectors,
+            documents=[doc.page_content for doc in batch],
+            metadatas=[doc.metadata for doc in batch]
+        )
+    
+    await asyncio.gather(*(embed_and_add(batch) for batch in batches))
+
+
 def store_vectors_to_chroma(text_chunks, collection_name="pdf_documents"):
     """
     将向量化后的文本存储到Chroma向量数据库中
@@ -135,21 +380,21 @@ def store_vectors_to_chroma(text_chunks, collection_name="pdf_documents"):
         Chroma: Chroma向量数据库实例
     """
     try:
-        # 初始化嵌入模型
-        embeddings = OllamaEmbeddings(
-            model="qwen3-embedding:0.6b",       # 确保这个模型已在 Ollama 中 pull 过
-            base_url="http://localhost:11434",  # 正确写法：不要加 /v1
-            # api_key="ollama",  # 如需要兼容某些接口可保留
-        )
+        # 获取嵌入模型
+        embeddings = _get_embeddings()
         
-        # 创建Chroma向量数据库并存储文本
-        vectorstore = Chroma.from_documents(
-            documents=text_chunks,
-            embedding=embeddings,
+        # 创建Chroma向量数据库
+        vectorstore = Chroma(
             collection_name=collection_name,
+            embedding_function=embeddings,
             persist_directory="./chroma_db"
         )
         
+        # 分批并发计算嵌入并写入数据库
+        # 异步HTTP客户端与事件循环绑定，每次运行使用新的嵌入模型实例，避免复用已关闭循环上的连接
+        batches = [text_chunks[i:i + EMBED_BATCH_SIZE] for i in range(0, len(text_chunks), EMBED_BATCH_SIZE)]
+        asyncio.run(_embed_and_add_batches(vectorstore, _create_embeddings(), batches))
+        
         # 持久化存储
         # vectorstore.persist()
         print(f"文本已成功存储到Chroma向量数据库，集合名称: {collection_name}")
@@ -172,12 +417,8 @@ def get_chroma_vectorstore(collection_name="pdf_documents", persist_directory=".
         Chroma: Chroma向量数据库实例
     """
     try:
-        # 初始化嵌入模型（与存储时使用的模型相同）
-        embeddings = OllamaEmbeddings(
-            model="qwen3-embedding:0.6b",       # 确保这个模型已在 Ollama 中 pull 过
-            base_url="http://localhost:11434",  # 正确写法：不要加 /v1
-            # api_key="ollama",  # 如需要兼容某些接口可保留
-        )
+        # 获取嵌入模型（与存储时使用的模型相同）
+        embeddings = _get_embeddings()
         
         # 加载本地存储的Chroma向量数据库
         vectorstore = Chroma(